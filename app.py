@@ -1,6 +1,8 @@
 import threading
-from flask import Flask, request, jsonify
+import queue
+from flask import Flask, request, jsonify, send_from_directory, url_for, abort
 import os
+import re
 import uuid
 import time
 from werkzeug.utils import secure_filename
@@ -8,12 +10,18 @@ from audio_processing import extract_audio
 import ffmpeg
 import shutil
 import subprocess
-from faster_whisper import WhisperModel
-from pitch_analysis import save_high_pitch_analysis
-from extract_goal_clips import extract_goal_clips  
+from faster_whisper import WhisperModel, decode_audio
+from pitch_analysis import save_high_pitch_analysis, build_transcription_windows
+from spectral_features import get_spectral_features
+from extract_goal_clips import extract_goal_clips, load_pitch_analysis, GOAL_MATCH_TOLERANCE, FRAGMENTED_MP4_FLAGS
+import torch
 from sentence_transformers import SentenceTransformer, util
 import json  
 from goal_keywords import goal_keywords  
+from streaming_upload import UploadSession, parse_content_range, extract_audio_while_uploading
+from word_index import WordTimestampIndex, collect_words, WORD_INDEX_FILENAME
+from embedding_cache import EmbeddingCache
+from resource_governor import governor
 
 app = Flask(__name__)
 
@@ -21,6 +29,7 @@ UPLOAD_FOLDER = "D:/FOOTECH/backend/uploaded"
 OUTPUT_FOLDER = "D:/FOOTECH/backend/OUTPUT"
 TRANSCRIPTION_FOLDER = "D:/FOOTECH/backend/TRANSCRIPTIONS"
 GOAL_CLIPS_FOLDER = "D:/FOOTECH/backend/Goal_Clips"
+EMBEDDING_CACHE_FILE = "D:/FOOTECH/backend/embedding_cache.sqlite"  # None keeps the cache in memory only
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs(TRANSCRIPTION_FOLDER, exist_ok=True)
@@ -31,6 +40,32 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024 * 1024  # 5GB max file size
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 app.config['TIMEOUT'] = 60 * 60
+# Run pitch analysis first and only transcribe padded windows around high pitch peaks
+app.config["PITCH_GATED_TRANSCRIPTION"] = False
+PITCH_GATE_PADDING = GOAL_MATCH_TOLERANCE + 8.0  # seconds of audio kept either side of a peak
+# Above this fraction of the match the windows cost more than one full pass, so the match is transcribed in full
+PITCH_GATE_MAX_COVERAGE = 0.5
+WHISPER_SAMPLE_RATE = 16000
+# Cut goal clips as fragmented MP4 and publish each one as soon as it is ready
+app.config["PROGRESSIVE_HIGHLIGHTS"] = False
+# Every job cuts its clips into GOAL_CLIPS_FOLDER/<job_id>, next to its own manifest
+HIGHLIGHTS_URL_PREFIX = "/highlights/"
+HIGHLIGHTS_MANIFEST_FILENAME = "manifest.json"
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+manifest_lock = threading.Lock()
+# Chunked, resumable uploads: audio is decoded and transcribed while the file is still arriving
+STREAMING_CHUNK_SECONDS = 120
+STREAMING_QUEUED_CHUNKS = 4  # decoded chunks buffered while transcription waits for the inference slot
+UPLOAD_IDLE_TIMEOUT = 5 * 60  # a chunked upload with no new bytes for this many seconds is aborted
+upload_sessions = {}
+upload_sessions_lock = threading.Lock()
+# Workspaces, clips and session state of finished jobs are removed after this many seconds
+JOB_TTL_SECONDS = 24 * 60 * 60
+finished_jobs = {}
+RETRY_AFTER_SECONDS = 120  # suggested wait before retrying an upload rejected by admission control
+# Sentence embeddings of recurring commentary, reused across matches
+SBERT_MODEL_NAME = "all-MiniLM-L6-v2"
+embedding_cache = EmbeddingCache(SBERT_MODEL_NAME, path=EMBEDDING_CACHE_FILE)
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -38,21 +73,75 @@ def allowed_file(filename):
 def preprocess_audio(input_file, output_file):
     if os.path.exists(output_file):
         os.remove(output_file)  # Automatically overwrite existing file
-    ffmpeg.input(input_file).output(output_file, ac=1, ar=16000).run(overwrite_output=True)
+    with governor.slot("ffmpeg"):
+        ffmpeg.input(input_file).output(output_file, ac=1, ar=16000).run(overwrite_output=True)
     print(f"Audio preprocessed and saved to {output_file}")
 
-def transcribe_audio_chunked(audio_file, model_size="small"):
-    model = WhisperModel(model_size, device="cuda", compute_type="float16")
-    segments, _ = model.transcribe(audio_file, word_timestamps=True)
+def transcribe_audio_chunked(audio_file, model_size="small", words=None):
+    with governor.slot("inference"):
+        model = WhisperModel(model_size, device="cuda", compute_type="float16")
+        segments, _ = model.transcribe(audio_file, word_timestamps=True)
+        
+        # Segments are decoded lazily, so the loop has to stay inside the inference slot
+        transcription = []
+        for segment in segments:
+            transcription.append({
+                "start": f"{segment.start:.2f}s",
+                "end": f"{segment.end:.2f}s",
+                "sentence": segment.text.strip()
+            })
+            if words is not None:
+                words.extend(collect_words(segment))
     
+    return transcription
+
+def transcribe_audio_array(model, audio, offset=0.0, words=None):
+    """
+    Transcribe a 16 kHz mono float32 array, shifting segment timestamps by offset seconds.
+    Word timings are appended to `words` when a list is given.
+    The caller holds the inference slot the model was built in.
+    """
+    segments, _ = model.transcribe(audio, word_timestamps=True)
     transcription = []
     for segment in segments:
         transcription.append({
-            "start": f"{segment.start:.2f}s",
-            "end": f"{segment.end:.2f}s",
+            "start": f"{segment.start + offset:.2f}s",
+            "end": f"{segment.end + offset:.2f}s",
             "sentence": segment.text.strip()
         })
+        if words is not None:
+            words.extend(collect_words(segment, offset))
+    return transcription
+
+def save_word_index(words, transcription_folder):
+    word_index_path = os.path.join(transcription_folder, WORD_INDEX_FILENAME)
+    WordTimestampIndex(words).save(word_index_path)
+    return word_index_path
+
+def transcribe_audio_windows(audio_file, windows, model_size="small", words=None):
+    """
+    Transcribe only the given (start, end) windows of the audio, remapping segment
+    timestamps from window time back to match time.
+    """
+    # The decoded match is held for the whole loop; memory is taken before inference
+    with governor.slot("memory"), governor.slot("inference"):
+        model = WhisperModel(model_size, device="cuda", compute_type="float16")
+        audio = decode_audio(audio_file, sampling_rate=WHISPER_SAMPLE_RATE)
+        total_duration = len(audio) / WHISPER_SAMPLE_RATE
+        
+        transcription = []
+        transcribed_seconds = 0.0
+        for window_start, window_end in windows:
+            window_end = min(window_end, total_duration)
+            if window_start >= window_end:
+                continue
+            window_audio = audio[int(window_start * WHISPER_SAMPLE_RATE):int(window_end * WHISPER_SAMPLE_RATE)]
+            transcribed_seconds += window_end - window_start
+            transcription.extend(transcribe_audio_array(model, window_audio, window_start, words))
     
+    if total_duration > 0:
+        print(f"Pitch-gated transcription covered {transcribed_seconds:.0f}s of {total_duration:.0f}s "
+              f"({100 * transcribed_seconds / total_duration:.1f}%) in {len(windows)} windows")
     return transcription
 
 def save_transcription_to_json(transcriptions, output_file):
@@ -60,49 +149,92 @@ def save_transcription_to_json(transcriptions, output_file):
         json.dump(transcriptions, json_file, indent=4)
     print(f"Transcription saved to {output_file}")
 
-def detect_goals_using_sbert(transcription_file):
-    model = SentenceTransformer('all-MiniLM-L6-v2', device='cuda')
+def find_goal_sentences(transcriptions):
+    goal_timestamps = []
+    with governor.slot("inference"):
+        model = SentenceTransformer(SBERT_MODEL_NAME, device='cuda')
+        goal_embeddings = torch.from_numpy(embedding_cache.encode(model, goal_keywords)).to('cuda')
+        
+        if transcriptions:
+            # Only sentences not seen in earlier matches go through the encoder
+            sentence_embeddings = embedding_cache.encode(model, [entry["sentence"] for entry in transcriptions])
+            similarity_scores = util.pytorch_cos_sim(torch.from_numpy(sentence_embeddings).to('cuda'), goal_embeddings)
+            max_scores = similarity_scores.max(dim=1).values.tolist()
+            
+            for entry, max_score in zip(transcriptions, max_scores):
+                if max_score > 0.6:
+                    goal_timestamps.append(entry)
     
+    embedding_cache.report()
+    return goal_timestamps
+
+def detect_goals_using_sbert(transcription_file, output_folder=TRANSCRIPTION_FOLDER):
     with open(transcription_file, "r") as file:
         transcriptions = json.load(file)
     
-    goal_embeddings = model.encode(goal_keywords, convert_to_tensor=True).to('cuda')
+    goal_timestamps = find_goal_sentences(transcriptions)
     
-    goal_timestamps = []
-    for entry in transcriptions:
-        sentence = entry["sentence"]
-        sentence_embedding = model.encode([sentence], convert_to_tensor=True).to('cuda')
-        
-        similarity_scores = util.pytorch_cos_sim(sentence_embedding, goal_embeddings)
-        
-        if similarity_scores.max().item() > 0.6:
-            goal_timestamps.append(entry)
-    
-    goal_timestamps_file = os.path.join(TRANSCRIPTION_FOLDER, "detected_goals.json")
+    goal_timestamps_file = os.path.join(output_folder, "detected_goals.json")
     with open(goal_timestamps_file, "w") as json_file:
         json.dump(goal_timestamps, json_file, indent=4)
     print(f"Goal-related sentences and timestamps saved to {goal_timestamps_file}")
     
     return goal_timestamps_file
 
-def process_audio_and_transcription(audio_path, transcription_folder, pitch_analysis_event):
-    try:
-        processed_audio_path = os.path.join(transcription_folder, "processed_audio.wav")
-        preprocess_audio(audio_path, processed_audio_path)
-        transcriptions = transcribe_audio_chunked(processed_audio_path)
-        transcription_file_path = os.path.join(transcription_folder, "transcription_with_timestamps.json")
+def transcribe_around_pitch_peaks(processed_audio_path, words=None):
+    """
+    Run the cheap pitch analysis first and transcribe only padded windows around its peaks.
+    Falls back to full transcription when the windows cover more than PITCH_GATE_MAX_COVERAGE of the match.
+    Returns the pitch analysis file and the (match time) transcription.
+    """
+    pitch_analysis_file = save_high_pitch_analysis(processed_audio_path)
+    if pitch_analysis_file is None:
+        return None, []
+    
+    high_pitch_segments = load_pitch_analysis(pitch_analysis_file)
+    # The spectral features were just computed by the pitch analysis, so this only reads their metadata
+    total_duration = get_spectral_features(processed_audio_path)["duration"]
+    windows = build_transcription_windows(high_pitch_segments, padding=PITCH_GATE_PADDING, total_duration=total_duration)
+    covered_seconds = sum(end - start for start, end in windows)
+    if total_duration <= 0 or covered_seconds / total_duration > PITCH_GATE_MAX_COVERAGE:
+        print(f"Pitch windows cover {covered_seconds:.0f}s of {total_duration:.0f}s, transcribing the full match instead")
+        return pitch_analysis_file, transcribe_audio_chunked(processed_audio_path, words=words)
+    return pitch_analysis_file, transcribe_audio_windows(processed_audio_path, windows, words=words)
+
+def raise_if_cancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise RuntimeError("Audio analysis was cancelled")
+
+def process_audio_and_transcription(audio_path, transcription_folder, pitch_analysis_event, pitch_gated=False, cancelled=None):
+    # Errors propagate to the caller, which reports them and sets the event.
+    # A set `cancelled` event stops the analysis at the next stage boundary.
+    processed_audio_path = os.path.join(transcription_folder, "processed_audio.wav")
+    preprocess_audio(audio_path, processed_audio_path)
+    raise_if_cancelled(cancelled)
+    transcription_file_path = os.path.join(transcription_folder, "transcription_with_timestamps.json")
+    words = []
+    if pitch_gated:
+        pitch_analysis_file, transcriptions = transcribe_around_pitch_peaks(processed_audio_path, words)
         save_transcription_to_json(transcriptions, transcription_file_path)
+    else:
+        transcriptions = transcribe_audio_chunked(processed_audio_path, words=words)
+        save_transcription_to_json(transcriptions, transcription_file_path)
+        raise_if_cancelled(cancelled)
         pitch_analysis_file = save_high_pitch_analysis(processed_audio_path)
-        
-        detected_goals_file = detect_goals_using_sbert(transcription_file_path)
-        
-        pitch_analysis_event.set()
-        return pitch_analysis_file, detected_goals_file
-    except Exception as e:
-        print(f"Audio processing failed: {str(e)}")
-        pitch_analysis_event.set()
+    save_word_index(words, transcription_folder)
+    raise_if_cancelled(cancelled)
+    
+    detected_goals_file = detect_goals_using_sbert(transcription_file_path, transcription_folder)
+    
+    pitch_analysis_event.set()
+    return pitch_analysis_file, detected_goals_file
 
-def extract_audio_in_background(video_path, output_folder, transcription_folder, pitch_analysis_event):
+def extract_audio_in_background(video_path, output_folder, transcription_folder, pitch_analysis_event, pitch_gated=False,
+                                errors=None, cancelled=None):
+    """
+    Extract and analyse the audio of a video. The event is always set when the thread ends;
+    a failure is appended to `errors` so the waiting job can fail instead of cutting clips.
+    """
     try:
         audio_filename = "extracted_audio.wav"
         audio_path = os.path.join(output_folder, audio_filename)
@@ -111,11 +243,16 @@ def extract_audio_in_background(video_path, output_folder, transcription_folder,
             os.remove(audio_path)
         
         extracted_audio_path = extract_audio(video_path, output_folder)
-        process_audio_and_transcription(extracted_audio_path, transcription_folder, pitch_analysis_event)
+        raise_if_cancelled(cancelled)
+        process_audio_and_transcription(extracted_audio_path, transcription_folder, pitch_analysis_event, pitch_gated, cancelled)
     except Exception as e:
         print(f"Audio processing failed: {str(e)}")
+        if errors is not None:
+            errors.append(e)
+    finally:
+        pitch_analysis_event.set()
 
-def merge_clips(clip_paths, output_path):
+def merge_clips(clip_paths, output_path, fragmented=False):
     temp_file = os.path.join(os.path.dirname(output_path), "concat_list.txt")
     with open(temp_file, "w") as f:
         for clip in clip_paths:
@@ -126,58 +263,391 @@ def merge_clips(clip_paths, output_path):
     
     command = [
         "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", temp_file,
-        "-c", "copy", output_path
+        "-c", "copy"
     ]
+    if fragmented:
+        command += FRAGMENTED_MP4_FLAGS
+    command.append(output_path)
     
     try:
-        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        with governor.slot("ffmpeg"):
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
     except subprocess.CalledProcessError as e:
         print(f"Error concatenating clips: {e}")
     finally:
         if os.path.exists(temp_file):
             os.remove(temp_file)
 
+def job_clips_folder(job_id):
+    return os.path.join(GOAL_CLIPS_FOLDER, job_id)
+
+def highlight_url(job_id, path):
+    return f"{HIGHLIGHTS_URL_PREFIX}{job_id}/{os.path.basename(path)}"
+
+def read_highlights_manifest(clips_folder):
+    manifest_path = os.path.join(clips_folder, HIGHLIGHTS_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as manifest_file:
+        return json.load(manifest_file)
+
+def write_highlights_manifest(clips_folder, manifest):
+    # Write then rename so clients polling the manifest never see a half-written file
+    manifest_path = os.path.join(clips_folder, HIGHLIGHTS_MANIFEST_FILENAME)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    os.replace(temp_path, manifest_path)
+
+def start_highlights_manifest(clips_folder):
+    os.makedirs(clips_folder, exist_ok=True)
+    with manifest_lock:
+        write_highlights_manifest(clips_folder, {"status": "processing", "clips": [], "final_clip": ""})
+
+def publish_highlight(clips_folder, clip_path, url, status=None, final=False):
+    with manifest_lock:
+        manifest = read_highlights_manifest(clips_folder) or {"status": "processing", "clips": [], "final_clip": ""}
+        if final:
+            manifest["final_clip"] = url
+        elif clip_path:
+            manifest["clips"].append({"filename": os.path.basename(clip_path), "url": url})
+        if status:
+            manifest["status"] = status
+        write_highlights_manifest(clips_folder, manifest)
+
+def generate_highlights(video_path, workspace, clips_folder, pitch_gated=False, progressive=False, on_clip=None):
+    """
+    Run audio analysis, cut the matched goal clips and merge them into the final highlight.
+    In progressive mode clips are written as fragmented MP4 and kept so they stay streamable.
+    Derived audio and analysis files are written to the job's workspace.
+    """
+    pitch_analysis_event = threading.Event()
+    cancelled = threading.Event()
+    errors = []
+    worker = threading.Thread(target=extract_audio_in_background, args=(video_path, workspace, workspace, pitch_analysis_event, pitch_gated, errors, cancelled))
+    worker.start()
+    
+    if not pitch_analysis_event.wait(timeout=app.config["TIMEOUT"]):
+        # Stop the worker at its next stage and wait for it, so the job keeps its running slot
+        # (and admission control counts it) until none of its work is left
+        cancelled.set()
+        worker.join()
+        raise RuntimeError("Audio analysis did not finish in time")
+    if errors:
+        raise RuntimeError(f"Audio analysis failed: {errors[0]}")
+    
+    return cut_highlights(video_path, workspace, clips_folder, progressive, on_clip)
+
+def cut_highlights(video_path, transcription_folder, clips_folder, progressive=False, on_clip=None):
+    """
+    Cut the goal clips matched by the finished audio analysis and merge them into the final highlight.
+    The pitch analysis, detected goals and word index are read from transcription_folder.
+    """
+    pitch_analysis_path = os.path.join(transcription_folder, "processed_audio_high_pitch_analysis.json")
+    if not os.path.exists(pitch_analysis_path):
+        # Pitch analysis found no high pitch segments, so there is nothing to cut
+        return ""
+    extracted_clips = extract_goal_clips(video_path, pitch_analysis_path, clips_folder, clip_duration=20,
+                                         fragmented=progressive, on_clip=on_clip)
+    
+    final_clip_path = ""
+    if extracted_clips:
+        final_clip_path = os.path.join(clips_folder, "extracted_clip.mp4")
+        merge_clips(extracted_clips, final_clip_path, fragmented=progressive)
+        if not progressive:
+            for clip in extracted_clips:
+                if os.path.exists(clip):
+                    os.remove(clip)
+    
+    return final_clip_path
+
+def generate_highlights_in_background(video_path, workspace, job_id, pitch_gated, ticket):
+    clips_folder = job_clips_folder(job_id)
+    
+    def on_clip(clip_path):
+        publish_highlight(clips_folder, clip_path, highlight_url(job_id, clip_path))
+    
+    try:
+        with ticket:
+            final_clip_path = generate_highlights(video_path, workspace, clips_folder, pitch_gated, progressive=True, on_clip=on_clip)
+        final_url = highlight_url(job_id, final_clip_path) if final_clip_path else ""
+        publish_highlight(clips_folder, None, final_url, status="done", final=True)
+    except Exception as e:
+        print(f"Highlight generation failed: {str(e)}")
+        publish_highlight(clips_folder, None, None, status="failed")
+    finally:
+        mark_job_finished(job_id)
+
+@app.route(HIGHLIGHTS_URL_PREFIX + "<job_id>/<filename>", methods=["GET"])
+def stream_highlight(job_id, filename):
+    """
+    Stream a highlight file of a job. Range requests are answered with 206 partial content,
+    so players can seek and start playback before the whole file is downloaded.
+    """
+    if not JOB_ID_PATTERN.match(job_id) or not filename.endswith(".mp4"):
+        abort(404)
+    return send_from_directory(job_clips_folder(job_id), filename, mimetype="video/mp4", conditional=True)
+
+@app.route(HIGHLIGHTS_URL_PREFIX + "<job_id>/manifest", methods=["GET"])
+def highlights_manifest(job_id):
+    manifest = read_highlights_manifest(job_clips_folder(job_id)) if JOB_ID_PATTERN.match(job_id) else None
+    if manifest is None:
+        return jsonify({"error": "Unknown highlights job"}), 404
+    return jsonify(manifest), 200
+
+def process_streaming_upload(session, ticket):
+    """
+    Background job of a chunked upload: decode and transcribe audio while the upload is in progress,
+    then run pitch analysis, goal detection and clip extraction once the file is complete.
+    """
+    try:
+        # The job stays queued, without a running slot, until the client starts sending data
+        session.wait_for_data(0, UPLOAD_IDLE_TIMEOUT)
+        if session.received == 0:
+            session.abort("No data received")
+            ticket.release()
+            return
+        with ticket:
+            run_streaming_upload(session)
+    finally:
+        mark_job_finished(session.upload_id)
+
+def run_streaming_upload(session):
+    try:
+        session.status = "uploading"
+        # Every derived file stays in the session workspace so concurrent uploads never share files
+        processed_audio_path = os.path.join(session.workspace, "processed_audio.wav")
+        transcriptions = []
+        words = []
+        audio_chunks = queue.Queue(maxsize=STREAMING_QUEUED_CHUNKS)
+        decoded = {}
+        
+        def decode_while_uploading():
+            # Waits on the network for most of the upload, so it only holds a "stream" slot
+            try:
+                with governor.slot("stream"):
+                    decoded["streamed"] = extract_audio_while_uploading(
+                        session, processed_audio_path, lambda samples, offset: audio_chunks.put((samples, offset)),
+                        STREAMING_CHUNK_SECONDS, UPLOAD_IDLE_TIMEOUT
+                    )
+            except Exception as e:
+                decoded["error"] = e
+            finally:
+                audio_chunks.put(None)
+        
+        decoder = threading.Thread(target=decode_while_uploading, daemon=True)
+        decoder.start()
+        
+        # Audio is awaited outside any slot; None marks the end of the decoded audio
+        model = None
+        chunk = audio_chunks.get()
+        while chunk is not None:
+            with governor.slot("inference"):
+                # Built inside the slot on first use and reused for the rest of the upload
+                if model is None:
+                    model = WhisperModel("small", device="cuda", compute_type="float16")
+                # Drain the chunks that queued up meanwhile, then give the slot back
+                while chunk is not None:
+                    samples, offset = chunk
+                    session.status = f"transcribing ({offset:.0f}s done)"
+                    transcriptions.extend(transcribe_audio_array(model, samples, offset, words))
+                    if audio_chunks.empty():
+                        break
+                    chunk = audio_chunks.get_nowait()
+            # Left the slot on an empty queue (wait for more audio) or on the end marker (done)
+            if chunk is not None:
+                chunk = audio_chunks.get()
+        model = None
+        decoder.join()
+        if "error" in decoded:
+            raise decoded["error"]
+        streamed = decoded["streamed"]
+        
+        if not session.wait_until_complete(UPLOAD_IDLE_TIMEOUT):
+            session.abort("Upload was not completed")
+            return
+        
+        if streamed:
+            transcription_file_path = os.path.join(session.workspace, "transcription_with_timestamps.json")
+            save_transcription_to_json(transcriptions, transcription_file_path)
+            save_word_index(words, session.workspace)
+            session.status = "analysing"
+            save_high_pitch_analysis(processed_audio_path)
+            detect_goals_using_sbert(transcription_file_path, session.workspace)
+            session.status = "cutting clips"
+            final_clip_path = cut_highlights(session.video_path, session.workspace, job_clips_folder(session.upload_id))
+        else:
+            # The container could not be demuxed from a pipe; process the finished file instead
+            session.status = "processing"
+            final_clip_path = generate_highlights(session.video_path, session.workspace, job_clips_folder(session.upload_id))
+        
+        session.result = {
+            "final_clip": final_clip_path,
+            "final_clip_url": highlight_url(session.upload_id, final_clip_path) if final_clip_path else ""
+        }
+        session.status = "done"
+    except Exception as e:
+        print(f"Streaming upload processing failed: {str(e)}")
+        session.status = "failed"
+        session.result = {"error": str(e)}
+
+def mark_job_finished(job_id):
+    with upload_sessions_lock:
+        finished_jobs[job_id] = time.time()
+
+def expire_finished_jobs():
+    """
+    Remove the session state, workspace and highlight clips of jobs finished more than JOB_TTL_SECONDS ago.
+    """
+    now = time.time()
+    with upload_sessions_lock:
+        expired = [job_id for job_id, finished_at in finished_jobs.items() if now - finished_at > JOB_TTL_SECONDS]
+        for job_id in expired:
+            del finished_jobs[job_id]
+            upload_sessions.pop(job_id, None)
+    for job_id in expired:
+        shutil.rmtree(os.path.join(app.config["UPLOAD_FOLDER"], job_id), ignore_errors=True)
+        shutil.rmtree(job_clips_folder(job_id), ignore_errors=True)
+
+@app.route("/upload/chunked/", methods=["POST"])
+def create_chunked_upload():
+    expire_finished_jobs()
+    filename = request.form.get("filename", "")
+    try:
+        total_size = int(request.form.get("size", ""))
+    except ValueError:
+        return jsonify({"error": "Missing or invalid upload size"}), 400
+    
+    if not allowed_file(filename):
+        allowed_formats = ", ".join(f".{ext}" for ext in ALLOWED_EXTENSIONS)
+        return jsonify({"error": f"Invalid file type. Allowed types are: {allowed_formats}"}), 400
+    if total_size <= 0 or total_size > app.config["MAX_CONTENT_LENGTH"]:
+        return jsonify({"error": "Invalid upload size"}), 400
+    
+    ticket = governor.try_admit()
+    if ticket is None:
+        return service_busy_response()
+    
+    upload_id = uuid.uuid4().hex
+    workspace = os.path.join(app.config["UPLOAD_FOLDER"], upload_id)
+    try:
+        session = UploadSession(upload_id, workspace, filename, total_size)
+    except Exception:
+        ticket.release()
+        shutil.rmtree(workspace, ignore_errors=True)
+        raise
+    with upload_sessions_lock:
+        upload_sessions[upload_id] = session
+    session.status = "queued"
+    threading.Thread(target=process_streaming_upload, args=(session, ticket)).start()
+    
+    return jsonify({**session.to_dict(), "upload_url": url_for("upload_chunk", upload_id=upload_id)}), 201
+
+@app.route("/upload/chunked/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    
+    content_range = parse_content_range(request.headers.get("Content-Range"))
+    if content_range is None:
+        return jsonify({"error": "Missing or invalid Content-Range header"}), 400
+    start, end, total = content_range
+    if (total is not None and total != session.total_size) or end >= session.total_size:
+        return jsonify({"error": "Content-Range does not match the upload size"}), 400
+    
+    accepted, received = session.write_chunk(start, request.stream, end - start + 1)
+    if not accepted:
+        # Offset mismatch or interrupted body: the client resumes from the received byte count
+        return jsonify({**session.to_dict(), "error": "Chunk not accepted, resume from received"}), 409
+    return jsonify(session.to_dict()), 200
+
+@app.route("/upload/chunked/<upload_id>", methods=["GET"])
+def chunked_upload_status(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    return jsonify(session.to_dict()), 200
+
+def service_busy_response():
+    response = jsonify({
+        "error": "Server is busy, please retry later",
+        **governor.stats()
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+    return response
+
+@app.route("/status/resources", methods=["GET"])
+def resource_status():
+    """
+    Queue depth and slot usage of the resource governor, for capacity planning.
+    """
+    return jsonify(governor.stats()), 200
+
 @app.route("/upload/", methods=["POST"])
 def upload_video():
+    expire_finished_jobs()
+    # Admission comes before the first access to request.files/request.form, which spools the whole body
+    ticket = governor.try_admit()
+    if ticket is None:
+        return service_busy_response()
+    
     if "file" not in request.files:
+        ticket.release()
         return jsonify({"error": "No file part in the request"}), 400
     
     file = request.files["file"]
     if file.filename == "":
+        ticket.release()
         return jsonify({"error": "No file selected"}), 400
     
     if not allowed_file(file.filename):
+        ticket.release()
         allowed_formats = ", ".join(f".{ext}" for ext in ALLOWED_EXTENSIONS)
         return jsonify({"error": f"Invalid file type. Allowed types are: {allowed_formats}"}), 400
     
+    # Each job gets its own workspace for the video and every derived file, so queued and running jobs never share files
+    job_id = uuid.uuid4().hex
+    workspace = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
     original_ext = file.filename.rsplit(".", 1)[1].lower()
     fixed_filename = f"uploaded_video.{original_ext}"
-    video_path = os.path.join(app.config["UPLOAD_FOLDER"], fixed_filename)
-    file.save(video_path)
-    
-    pitch_analysis_event = threading.Event()
-    threading.Thread(target=extract_audio_in_background, args=(video_path, OUTPUT_FOLDER, TRANSCRIPTION_FOLDER, pitch_analysis_event)).start()
-    
-    pitch_analysis_event.wait()
+    video_path = os.path.join(workspace, fixed_filename)
+    try:
+        os.makedirs(workspace, exist_ok=True)
+        file.save(video_path)
+    except Exception:
+        ticket.release()
+        shutil.rmtree(workspace, ignore_errors=True)
+        raise
     
-    pitch_analysis_path = os.path.join(TRANSCRIPTION_FOLDER, "processed_audio_high_pitch_analysis.json")
-    goal_clips_folder = os.path.join("D:/FOOTECH/backend", "Goal_Clips")
-    os.makedirs(goal_clips_folder, exist_ok=True)
+    pitch_gated = request.form.get("pitch_gated", str(app.config["PITCH_GATED_TRANSCRIPTION"])).lower() in ("1", "true", "yes")
+    progressive = request.form.get("progressive", str(app.config["PROGRESSIVE_HIGHLIGHTS"])).lower() in ("1", "true", "yes")
     
-    extracted_clips = extract_goal_clips(video_path, pitch_analysis_path, goal_clips_folder, clip_duration=20)
+    if progressive:
+        start_highlights_manifest(job_clips_folder(job_id))
+        threading.Thread(target=generate_highlights_in_background, args=(video_path, workspace, job_id, pitch_gated, ticket)).start()
+        return jsonify({
+            "message": "File uploaded successfully. Highlights are being generated.",
+            "job_id": job_id,
+            "video_path": video_path,
+            "manifest": url_for("highlights_manifest", job_id=job_id)
+        }), 202
     
-    final_clip_path = ""
-    if extracted_clips:
-        final_clip_path = os.path.join(goal_clips_folder, "extracted_clip.mp4")
-        merge_clips(extracted_clips, final_clip_path)
-        for clip in extracted_clips:
-            if os.path.exists(clip):
-                os.remove(clip)
+    try:
+        with ticket:
+            final_clip_path = generate_highlights(video_path, workspace, job_clips_folder(job_id), pitch_gated)
+    except RuntimeError as e:
+        return jsonify({"error": str(e), "job_id": job_id}), 500
+    finally:
+        mark_job_finished(job_id)
     
     return jsonify({
         "message": "File uploaded successfully.",
+        "job_id": job_id,
         "video_path": video_path,
-        "final_clip": final_clip_path
+        "final_clip": final_clip_path,
+        "final_clip_url": highlight_url(job_id, final_clip_path) if final_clip_path else ""
     }), 200
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 import os
 import subprocess
+from resource_governor import governor
 
 def extract_audio(video_path, output_dir):
     os.makedirs(output_dir, exist_ok=True)
@@ -9,7 +10,8 @@ def extract_audio(video_path, output_dir):
     command = f"ffmpeg -i \"{video_path}\" -q:a 0 -map a \"{audio_path}\""
 
 
-    subprocess.run(command, shell=True, check=True)
+    with governor.slot("ffmpeg"):
+        subprocess.run(command, shell=True, check=True)
 
     
     return audio_path
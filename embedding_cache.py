@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+
+def normalize_text(text):
+    """
+    Normalise a sentence for cache lookup: lowercase and collapse whitespace.
+    The SBERT models used here have uncased tokenizers, so this does not change the embedding.
+    """
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of sentence embeddings, keyed by model name and normalised text.
+    Commentary repeats itself across matches, so repeated phrases skip the encoder.
+
+    With a path, entries are also persisted in a SQLite file (WAL mode) that survives restarts
+    and can be shared by several worker processes; it is trimmed to max_persisted_entries by
+    least recent use.
+    """
+
+    def __init__(self, model_name, max_entries=50000, path=None, max_persisted_entries=500000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.path = path
+        self.max_persisted_entries = max_persisted_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+                    "PRIMARY KEY (model, text))"
+                )
+                connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation: sqlite3 connections must not be shared across threads
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_persisted(self, keys):
+        if not self.path or not keys:
+            return {}
+        found = {}
+        with self._connect() as connection:
+            for key in keys:
+                row = connection.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text = ?", (self.model_name, key)
+                ).fetchone()
+                if row is not None:
+                    found[key] = np.frombuffer(row[0], dtype=np.float32)
+            now = time.time()
+            connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text = ?",
+                [(now, self.model_name, key) for key in found]
+            )
+        return found
+
+    def _persist(self, vectors):
+        if not self.path or not vectors:
+            return
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model_name, key, vector.astype(np.float32).tobytes(), now) for key, vector in vectors.items()]
+            )
+            connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_persisted_entries,)
+            )
+
+    def encode(self, model, sentences, batch_size=64):
+        """
+        Return embeddings for sentences as a float32 array of shape (len(sentences), dim),
+        encoding only the normalised sentences not found in the cache, in one batch.
+        """
+        keys = [normalize_text(sentence) for sentence in sentences]
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    vectors[key] = self._entries[key]
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        persisted = self._load_persisted(missing)
+        missing = [key for key in missing if key not in persisted]
+
+        encoded = {}
+        if missing:
+            embeddings = model.encode(missing, batch_size=batch_size, convert_to_numpy=True)
+            encoded = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, embeddings)}
+            self._persist(encoded)
+
+        with self._lock:
+            for key, vector in {**persisted, **encoded}.items():
+                self._remember(key, vector)
+            # Every sentence served without running the encoder counts as a hit
+            self.misses += len(encoded)
+            self.hits += len(keys) - len(encoded)
+
+        vectors.update(persisted)
+        vectors.update(encoded)
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate
+        }
+
+    def report(self):
+        print(f"Embedding cache ({self.model_name}): {self.hits} hits, {self.misses} misses, "
+              f"hit rate {self.hit_rate:.1%}, {len(self._entries)} entries in memory")
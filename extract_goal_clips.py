@@ -1,6 +1,15 @@
 import os
 import json
 import subprocess
+from goal_keywords import goal_keywords
+from word_index import WordTimestampIndex, WORD_INDEX_FILENAME
+from resource_governor import governor
+
+# Fragmented MP4 flags: the file is playable (and streamable) while later fragments are still being written
+FRAGMENTED_MP4_FLAGS = ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+
+# Tolerance window (in seconds) for matching pitch and goal commentary timestamps
+GOAL_MATCH_TOLERANCE = 12.0  # Increased from 8.0 to 12.0 seconds for better matching
 
 def get_video_duration(video_path):
     """
@@ -49,7 +58,56 @@ def load_detected_goals(detected_goals_file):
             entry["end"] = float(entry["end"].replace("s", "").strip())
     return data
 
-def extract_goal_clips(video_path, pitch_analysis_file, output_folder, clip_duration=20, use_ffmpeg=False):
+def find_matching_goal(pitch_timestamp, goal_data, tolerance=GOAL_MATCH_TOLERANCE):
+    """
+    Find the first goal event whose commentary lies within the tolerance window of a pitch timestamp.
+    
+    :param pitch_timestamp: Timestamp of the high pitch moment in seconds.
+    :param goal_data: List of goal event dictionaries with float "start" and "end" values.
+    :param tolerance: Tolerance window in seconds on either side of the goal commentary.
+    :return: The matching goal event dictionary, or None if there is no match.
+    """
+    for goal in goal_data:
+        if (goal["start"] - tolerance) <= pitch_timestamp <= (goal["end"] + tolerance):
+            return goal
+    return None
+
+def locate_goal_event(goal, word_index=None):
+    """
+    Find the time to centre a clip on for a matched goal event.
+    Uses the start of the goal keyword spoken in the segment when a word index is available,
+    otherwise the midpoint of the commentary segment.
+    
+    :param goal: Goal event dictionary with float "start" and "end" values.
+    :param word_index: Optional WordTimestampIndex of the match transcription.
+    :return: Event centre in seconds.
+    """
+    if word_index is not None:
+        keyword_match = word_index.locate_keyword(goal["start"], goal["end"], goal_keywords)
+        if keyword_match is not None:
+            keyword, keyword_start, _ = keyword_match
+            print(f"Anchored on keyword '{keyword}' at {keyword_start:.2f}s")
+            return keyword_start
+    return (goal["start"] + goal["end"]) / 2.0
+
+def compute_clip_bounds(event_center, clip_duration, video_duration=None):
+    """
+    Compute start and end times of a clip centred on an event, kept inside the video.
+    
+    :return: Tuple (start_time, end_time) in seconds.
+    """
+    half_duration = clip_duration / 2.0
+    start_time = max(event_center - half_duration, 0)
+    end_time = event_center + half_duration
+
+    # Adjust clip boundaries if end_time exceeds video duration
+    if video_duration and end_time > video_duration:
+        start_time = max(video_duration - clip_duration, 0)
+        end_time = start_time + clip_duration
+    return start_time, end_time
+
+def extract_goal_clips(video_path, pitch_analysis_file, output_folder, clip_duration=20, use_ffmpeg=False,
+                       fragmented=False, on_clip=None):
     """
     Extracts video clips from the given video based on high pitch timestamps that match goal-related commentary.
     Cross matches high pitch timestamps with goal commentary timestamps (from detected_goals.json) using a tolerance window.
@@ -59,6 +117,8 @@ def extract_goal_clips(video_path, pitch_analysis_file, output_folder, clip_dura
     :param output_folder: Folder where extracted clips will be saved.
     :param clip_duration: Total duration of each extracted clip (in seconds).
     :param use_ffmpeg: Optional parameter to specify whether to use FFmpeg (default False, not used internally).
+    :param fragmented: Write each clip as fragmented MP4 so it can be streamed progressively.
+    :param on_clip: Optional callback called with the path of each clip as soon as it is extracted.
     :return: List of file paths to the extracted clips.
     """
     # Load pitch analysis data
@@ -68,15 +128,14 @@ def extract_goal_clips(video_path, pitch_analysis_file, output_folder, clip_dura
     detected_goals_file = os.path.join(os.path.dirname(pitch_analysis_file), "detected_goals.json")
     goal_data = load_detected_goals(detected_goals_file)
     
-    # Define tolerance window (in seconds) for matching pitch and goal commentary timestamps
-    tolerance = 12.0  # Increased from 8.0 to 12.0 seconds for better matching
+    # Word timings of the transcription, used to centre clips on the spoken goal keyword
+    word_index = WordTimestampIndex.load(os.path.join(os.path.dirname(pitch_analysis_file), WORD_INDEX_FILENAME))
     
     # Create output folder if it does not exist
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
     clips = []
-    half_duration = clip_duration / 2.0  # For 20 seconds, half_duration is 10 seconds
     
     # Get total video duration to ensure clip boundaries are valid
     video_duration = get_video_duration(video_path)
@@ -93,32 +152,20 @@ def extract_goal_clips(video_path, pitch_analysis_file, output_folder, clip_dura
             continue
 
         # Check if this pitch timestamp has a matching goal event within the tolerance window
-        match_found = False
-        matched_goal = None
-        for goal in goal_data:
-            if (goal["start"] - tolerance) <= pitch_timestamp <= (goal["end"] + tolerance):
-                match_found = True
-                matched_goal = goal
-                break
-
-        if not match_found:
+        matched_goal = find_matching_goal(pitch_timestamp, goal_data)
+
+        if matched_goal is None:
             continue  # Skip this pitch segment if no matching goal event is found
 
-        # Calculate event center using the detected goal segment from commentary (simple midpoint)
-        event_center = (matched_goal["start"] + matched_goal["end"]) / 2.0
+        # Calculate event center from the matched goal keyword (or the segment midpoint without a word index)
+        event_center = locate_goal_event(matched_goal, word_index)
 
         # Debug: Print matched goal event and event center
         print(f"Matched goal event: Start = {matched_goal['start']}, End = {matched_goal['end']}")
-        print(f"Calculated event center (midpoint): {event_center}")
+        print(f"Calculated event center: {event_center}")
 
         # Compute start and end times for clip extraction using the event center (ensuring start_time is not negative)
-        start_time = max(event_center - half_duration, 0)
-        end_time = event_center + half_duration
-
-        # Adjust clip boundaries if end_time exceeds video duration
-        if video_duration and end_time > video_duration:
-            start_time = max(video_duration - clip_duration, 0)
-            end_time = start_time + clip_duration
+        start_time, end_time = compute_clip_bounds(event_center, clip_duration, video_duration)
 
         # Prevent duplicate extraction for overlapping clips
         if start_time < last_clip_end:
@@ -140,13 +187,18 @@ def extract_goal_clips(video_path, pitch_analysis_file, output_folder, clip_dura
             "-ss", str(start_time),  # Start time
             "-t", str(clip_duration),  # Duration
             "-c:v", "h264_nvenc", "-c:a", "aac", "-strict", "experimental",  # Encoding options using CUDA (NVIDIA GPU)
-            clip_filename  # Output file
         ]
+        if fragmented:
+            command += FRAGMENTED_MP4_FLAGS
+        command.append(clip_filename)  # Output file
 
         try:
-            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            with governor.slot("ffmpeg"):
+                subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
             clips.append(clip_filename)
             print(f"Extracted clip {idx+1}: {clip_filename}")
+            if on_clip is not None:
+                on_clip(clip_filename)
         except subprocess.CalledProcessError:
             print(f"Error extracting clip {idx+1}")
 
@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+
+
+class FrameRingBuffer:
+    """
+    Bounded, thread-safe buffer of decoded frames shared by a decoder thread and the player.
+    Frames are stored as (frame_index, frame) pairs. The producer blocks while the buffer is
+    full and the consumer can drop stale frames to catch up with the playback clock.
+    Has no GUI dependencies so it can be exercised headlessly.
+    """
+
+    def __init__(self, capacity=32):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._frames = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._finished = False
+        self.dropped = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._frames)
+
+    def put(self, frame_index, frame, timeout=None):
+        """
+        Append a frame, waiting for space if the buffer is full.
+        Returns False if the buffer was closed or the wait timed out.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._closed or len(self._frames) < self.capacity, timeout
+            ):
+                return False
+            if self._closed:
+                return False
+            self._frames.append((frame_index, frame))
+            self._condition.notify_all()
+            return True
+
+    def pop_due(self, due_index):
+        """
+        Return the newest buffered frame with index <= due_index, discarding older frames.
+        Returns None if no frame is due yet.
+        """
+        with self._condition:
+            latest = None
+            while self._frames and self._frames[0][0] <= due_index:
+                if latest is not None:
+                    self.dropped += 1
+                latest = self._frames.popleft()
+            if latest is not None:
+                self._condition.notify_all()
+            return latest
+
+    def peek_index(self):
+        """
+        Return the index of the oldest buffered frame, or None if the buffer is empty.
+        """
+        with self._condition:
+            return self._frames[0][0] if self._frames else None
+
+    def finish(self):
+        """
+        Mark the end of the stream; the consumer drains what is left.
+        """
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Stop the producer and discard any buffered frames.
+        """
+        with self._condition:
+            self._closed = True
+            self._frames.clear()
+            self._condition.notify_all()
+
+    @property
+    def exhausted(self):
+        """
+        True once the producer finished (or the buffer was closed) and no frames are left.
+        """
+        with self._condition:
+            return (self._finished or self._closed) and not self._frames
@@ -5,12 +5,14 @@ import torch
 from sentence_transformers import SentenceTransformer, util
 import numpy as np
 from goal_keywords import goal_keywords  
+from embedding_cache import EmbeddingCache
 
 
 
 
 TRANSCRIPTION_FILE = "D:/FOOTECH/backend/OUTPUT/TRANSCRIPTION/transcription_with_timestamps.txt"
 OUTPUT_JSON_FILE = "D:/FOOTECH/backend/OUTPUT/TRANSCRIPTION/detected_goal_segments.json"
+EMBEDDING_CACHE_FILE = "D:/FOOTECH/backend/embedding_cache.sqlite"  # None keeps the cache in memory only
 
 
 SIMILARITY_THRESHOLD = 0.65  
@@ -21,11 +23,14 @@ device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 print(f"Using device: {device}")
 
 
-model = SentenceTransformer("all-mpnet-base-v2")
+SBERT_MODEL_NAME = "all-mpnet-base-v2"
+model = SentenceTransformer(SBERT_MODEL_NAME)
 model.to(device)  # Move model to GPU if available
 
 
-goal_embeddings = model.encode(goal_keywords, convert_to_tensor=True).to(device)
+# Recurring commentary is embedded once and reused across matches
+embedding_cache = EmbeddingCache(SBERT_MODEL_NAME, path=EMBEDDING_CACHE_FILE)
+goal_embeddings = torch.from_numpy(embedding_cache.encode(model, goal_keywords)).to(device)
 
 
 
@@ -115,25 +120,26 @@ def find_goal_segments(transcription_segments, similarity_threshold=SIMILARITY_T
     Incorporates an initial filtering step with is_goal_related() to remove clear negations.
     Implements a two-stage filtering approach: for sentences with ambiguous similarity scores (between the initial
     and stricter threshold), an explicit keyword check is applied.
+    Sentence embeddings come from the embedding cache, so only unseen sentences are encoded.
     """
     detected_segments = []
     similarity_scores = []
 
-    for segment in transcription_segments:
-        sentence = segment.get("sentence", "")
-        if not sentence:
-            continue
-
-       
-        if not is_goal_related(sentence):
-            continue
-
-        
-        sentence_embedding = model.encode(sentence, convert_to_tensor=True).to(device)
-        
-        
-        similarity_scores_ = util.pytorch_cos_sim(sentence_embedding, goal_embeddings)
-        max_similarity = float(np.max(similarity_scores_.cpu().numpy()))
+    candidates = [
+        segment for segment in transcription_segments
+        if segment.get("sentence", "") and is_goal_related(segment["sentence"])
+    ]
+    if not candidates:
+        return detected_segments, adjust_threshold(similarity_scores, similarity_threshold)
+
+    sentence_embeddings = embedding_cache.encode(model, [segment["sentence"] for segment in candidates])
+    similarity_matrix = util.pytorch_cos_sim(torch.from_numpy(sentence_embeddings).to(device), goal_embeddings)
+    max_similarities = similarity_matrix.max(dim=1).values.cpu().numpy()
+    embedding_cache.report()
+
+    for segment, max_similarity in zip(candidates, max_similarities):
+        sentence = segment["sentence"]
+        max_similarity = float(max_similarity)
         similarity_scores.append(max_similarity)
 
         
@@ -1,20 +1,20 @@
 import librosa
 import numpy as np
 import json
+from collections import deque
+from spectral_features import get_spectral_features, N_FFT, HOP_LENGTH
+from pitch_sketch import QuantileSketch, RunningMoments
+from resource_governor import governor
 
 
-def determine_dynamic_threshold(pitches, k=2.5):
-    
-    all_pitches = pitches[pitches > 0]  
-
-    if len(all_pitches) == 0:
-        return None  
-
-    mean_pitch = np.mean(all_pitches)
-    std_pitch = np.std(all_pitches)
-    
-    q1 = np.percentile(all_pitches, 25)
-    q3 = np.percentile(all_pitches, 75)
+def threshold_from_statistics(mean_pitch, std_pitch, percentile, k=2.5, verbose=True):
+    """
+    Combine pitch statistics into the dynamic threshold.
+    `percentile` is a function returning the q-th percentile (0-100) of the positive pitches,
+    so the exact and the summary based paths share the same rule.
+    """
+    q1 = percentile(25)
+    q3 = percentile(75)
     iqr = q3 - q1
 
     
@@ -25,7 +25,7 @@ def determine_dynamic_threshold(pitches, k=2.5):
         adaptive_percentile = 80
     else:
         adaptive_percentile = 75
-    percentile_value = np.percentile(all_pitches, adaptive_percentile)
+    percentile_value = percentile(adaptive_percentile)
 
     
     adaptive_k = k * (1 + std_pitch / mean_pitch)
@@ -33,86 +33,307 @@ def determine_dynamic_threshold(pitches, k=2.5):
    
     threshold = min(q3 + adaptive_k * iqr, percentile_value)
 
-    print(f"Dynamic threshold: {round(threshold, 2)} Hz (Mean: {round(mean_pitch, 2)}, Std: {round(std_pitch, 2)}, {adaptive_percentile}th Percentile: {round(percentile_value, 2)})")
+    if verbose:
+        print(f"Dynamic threshold: {round(threshold, 2)} Hz (Mean: {round(mean_pitch, 2)}, Std: {round(std_pitch, 2)}, {adaptive_percentile}th Percentile: {round(percentile_value, 2)})")
     return threshold
 
 
-def perform_pitch_analysis(audio_path, time_interval=0.5, min_duration=2, min_separation=10):
+def determine_dynamic_threshold(pitches, k=2.5):
+    
+    all_pitches = pitches[pitches > 0]  
+
+    if len(all_pitches) == 0:
+        return None  
+
+    mean_pitch = np.mean(all_pitches)
+    std_pitch = np.std(all_pitches)
+
+    return threshold_from_statistics(mean_pitch, std_pitch, lambda q: np.percentile(all_pitches, q), k)
+
+
+def histogram_percentile(histogram, edges, q):
     """
-    Perform pitch analysis on an audio file, capturing pitch data with high pitch moment separation.
+    Approximate np.percentile (linear interpolation) from a histogram of values.
+    Within a bin the values are assumed to be spread geometrically, matching the log-spaced bins.
     """
-    try:
+    cumulative = np.cumsum(histogram)
+    total = cumulative[-1]
+    rank = q / 100.0 * (total - 1)
+    # Bin holding the value of 0-based rank `rank`
+    bin_index = int(np.searchsorted(cumulative, rank, side="right"))
+    bin_index = min(bin_index, len(histogram) - 1)
+    before = cumulative[bin_index - 1] if bin_index > 0 else 0
+    fraction = (rank - before + 0.5) / histogram[bin_index]
+    fraction = min(max(fraction, 0.0), 1.0)
+    return edges[bin_index] * (edges[bin_index + 1] / edges[bin_index]) ** fraction
+
+
+def threshold_from_summaries(features, k=2.5, verbose=True):
+    """
+    Re-derive the dynamic threshold from the persisted per-frame pitch summaries and pitch histogram,
+    without reloading the audio or re-running piptrack.
+    """
+    count = float(np.sum(features["pitch_count"], dtype=np.float64))
+    if count == 0:
+        return None
+
+    mean_pitch = np.sum(features["pitch_sum"], dtype=np.float64) / count
+    variance = np.sum(features["pitch_sumsq"], dtype=np.float64) / count - mean_pitch ** 2
+    std_pitch = np.sqrt(max(variance, 0.0))
+    histogram = features["pitch_histogram"]
+    edges = features["pitch_histogram_edges"]
+
+    return threshold_from_statistics(mean_pitch, std_pitch, lambda q: histogram_percentile(histogram, edges, q), k, verbose)
+
+
+def scan_high_pitch_segments(frame_max, pitch_threshold, frame_time_step, time_interval=0.5, min_duration=2, min_separation=10):
+    """
+    Scan per-frame maximum pitch values for sustained high pitch moments separated by at least min_separation seconds.
+    `pitch_threshold` is a single value or one value per frame (rolling threshold).
+    """
+    num_frames = len(frame_max)
+    thresholds = np.broadcast_to(pitch_threshold, (num_frames,))
+    step_size = max(1, int(round(time_interval / frame_time_step)))  
+
+   
+    high_pitch_segments = []
+    consecutive_high_pitch_count = 0
+    potential_segments = []
+
+    
+    for t in range(0, num_frames, step_size):
+        max_pitch = frame_max[t]
+        time_in_seconds = round(t * frame_time_step)
+        
         
-        y, sr = librosa.load(audio_path, sr=None)
-        print(f"Audio loaded from {audio_path}, sample rate: {sr}")
+        neighbor_condition = False
+        if t > 0:
+            if frame_max[t - 1] > thresholds[t] * 0.8:
+                neighbor_condition = True
+        if t < num_frames - 1:
+            if frame_max[t + 1] > thresholds[t] * 0.8:
+                neighbor_condition = True
 
-       
-        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+        if max_pitch > thresholds[t] or neighbor_condition:
+            consecutive_high_pitch_count += 1
+            if consecutive_high_pitch_count >= min_duration / time_interval:
+                potential_segments.append({
+                    "timestamp": int(time_in_seconds),
+                    "pitch": round(float(max_pitch), 2)
+                })
+                consecutive_high_pitch_count = 0
+        else:
+            consecutive_high_pitch_count = 0
+
+   
+    if potential_segments:
+        high_pitch_segments.append(potential_segments[0])  
+        last_timestamp = potential_segments[0]["timestamp"]
+        
+        for segment in potential_segments[1:]:
+            current_timestamp = segment["timestamp"]
+            if current_timestamp - last_timestamp >= min_separation:
+                high_pitch_segments.append(segment)
+                last_timestamp = current_timestamp
 
+    return high_pitch_segments
+
+
+def perform_pitch_analysis(audio_path, time_interval=0.5, min_duration=2, min_separation=10, k=2.5):
+    """
+    Perform pitch analysis on an audio file, capturing pitch data with high pitch moment separation.
+    Reads per-frame pitch from the shared spectral feature store, computing it only on first use.
+    """
+    try:
         
-        pitch_threshold = determine_dynamic_threshold(pitches, k=2.5)
+        features = get_spectral_features(audio_path)
+        print(f"Spectral features loaded for {audio_path}, sample rate: {features['sample_rate']}")
+
+        # The stored threshold is exact for the k it was computed with; other k come from the summaries
+        if features["k"] == k:
+            pitch_threshold = features["pitch_threshold"]
+        else:
+            pitch_threshold = threshold_from_summaries(features, k)
         if pitch_threshold is None:
             print("No pitch data found, skipping analysis.")
             return []
 
-        
-        total_duration = len(y) / sr
-        num_frames = pitches.shape[1]
-        frame_time_step = total_duration / num_frames  
-        step_size = max(1, int(round(time_interval / frame_time_step)))  
+        high_pitch_segments = scan_high_pitch_segments(
+            features["pitch_max"], pitch_threshold, features["frame_time_step"],
+            time_interval, min_duration, min_separation
+        )
 
-       
-        high_pitch_segments = []
-        consecutive_high_pitch_count = 0
-        last_high_pitch_timestamp = -min_separation  
-        potential_segments = []
+        print(f"Detected {len(high_pitch_segments)} high pitch segments after filtering.")
+        return high_pitch_segments
+    except Exception as e:
+        print(f"Error during pitch analysis: {str(e)}")
+        return []
 
-        
-        for t in range(0, num_frames, step_size):
-            pitch_values = pitches[:, t]
-            max_pitch = np.max(pitch_values) if pitch_values.any() else 0
-            time_in_seconds = round(t * frame_time_step)
-            
-            
-            neighbor_condition = False
-            if t > 0:
-                prev_max = np.max(pitches[:, t - 1])
-                if prev_max > pitch_threshold * 0.8:
-                    neighbor_condition = True
-            if t < num_frames - 1:
-                next_max = np.max(pitches[:, t + 1])
-                if next_max > pitch_threshold * 0.8:
-                    neighbor_condition = True
-
-            if max_pitch > pitch_threshold or neighbor_condition:
-                consecutive_high_pitch_count += 1
-                if consecutive_high_pitch_count >= min_duration / time_interval:
-                    potential_segments.append({
-                        "timestamp": int(time_in_seconds),
-                        "pitch": round(float(max_pitch), 2)
-                    })
-                    consecutive_high_pitch_count = 0
-            else:
-                consecutive_high_pitch_count = 0
 
-       
-        if potential_segments:
-            high_pitch_segments.append(potential_segments[0])  
-            last_timestamp = potential_segments[0]["timestamp"]
-            
-            for segment in potential_segments[1:]:
-                current_timestamp = segment["timestamp"]
-                if current_timestamp - last_timestamp >= min_separation:
-                    high_pitch_segments.append(segment)
-                    last_timestamp = current_timestamp
+def threshold_from_sketch(sketch, moments, k=2.5, verbose=True):
+    """
+    Dynamic threshold from a quantile sketch and running moments of the positive pitches.
+    """
+    if moments.count == 0:
+        return None
+    return threshold_from_statistics(moments.mean, moments.std, sketch.percentile, k, verbose)
+
+
+def streaming_dynamic_thresholds(audio_path, k=2.5, block_seconds=30, window_seconds=300, relative_accuracy=0.005):
+    """
+    Estimate the dynamic pitch threshold block by block in constant memory.
+    Each block of audio is pitch tracked on its own and only its positive pitches' sketch and moments
+    are kept, so the full pitch matrix never exists.
+
+    :return: Dictionary with the global threshold, a per-frame rolling threshold computed over the
+             trailing window_seconds, the per-frame maximum pitch and the frame time step.
+    """
+    sr = librosa.get_samplerate(audio_path)
+    frame_time_step = HOP_LENGTH / sr
+    block_length = max(1, int(block_seconds / frame_time_step))
+    window_blocks = max(1, int(round(window_seconds / block_seconds)))
+
+    global_sketch = QuantileSketch(relative_accuracy)
+    global_moments = RunningMoments()
+    recent_blocks = deque(maxlen=window_blocks)
+    frame_max_blocks = []
+    rolling_blocks = []
+
+    # Blocks are small, but the per-frame outputs still grow with the match length
+    with governor.slot("memory"):
+        stream = librosa.stream(audio_path, block_length=block_length, frame_length=N_FFT,
+                                hop_length=HOP_LENGTH, mono=True, fill_value=0)
+        for block in stream:
+            pitches, _ = librosa.piptrack(y=block, sr=sr, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False)
+            positive = pitches[pitches > 0]
+
+            block_sketch = QuantileSketch(relative_accuracy)
+            block_sketch.add(positive)
+            block_moments = RunningMoments()
+            block_moments.add(positive)
+            global_sketch.merge(block_sketch)
+            global_moments.merge(block_moments)
+            recent_blocks.append((block_sketch, block_moments))
+
+            window_sketch = QuantileSketch(relative_accuracy)
+            window_moments = RunningMoments()
+            for sketch, moments in recent_blocks:
+                window_sketch.merge(sketch)
+                window_moments.merge(moments)
+            rolling = threshold_from_sketch(window_sketch, window_moments, k, verbose=False)
+
+            frame_max_blocks.append(pitches.max(axis=0))
+            rolling_blocks.append(np.full(pitches.shape[1], np.inf if rolling is None else rolling))
+
+    frame_max = np.concatenate(frame_max_blocks) if frame_max_blocks else np.zeros(0)
+    return {
+        "global_threshold": threshold_from_sketch(global_sketch, global_moments, k),
+        "rolling_thresholds": np.concatenate(rolling_blocks) if rolling_blocks else np.zeros(0),
+        "pitch_max": frame_max,
+        "frame_time_step": frame_time_step
+    }
+
+
+def perform_streaming_pitch_analysis(audio_path, rolling=False, k=2.5, time_interval=0.5, min_duration=2,
+                                     min_separation=10, block_seconds=30, window_seconds=300):
+    """
+    Pitch analysis with the threshold estimated block by block in constant memory.
+    With rolling=True each frame is compared against the threshold of the trailing window,
+    so the threshold follows changes in crowd noise during the match.
+    """
+    try:
+        estimate = streaming_dynamic_thresholds(audio_path, k, block_seconds, window_seconds)
+        if estimate["global_threshold"] is None:
+            print("No pitch data found, skipping analysis.")
+            return []
+
+        pitch_threshold = estimate["rolling_thresholds"] if rolling else estimate["global_threshold"]
+        high_pitch_segments = scan_high_pitch_segments(
+            estimate["pitch_max"], pitch_threshold, estimate["frame_time_step"],
+            time_interval, min_duration, min_separation
+        )
 
         print(f"Detected {len(high_pitch_segments)} high pitch segments after filtering.")
         return high_pitch_segments
     except Exception as e:
-        print(f"Error during pitch analysis: {str(e)}")
+        print(f"Error during streaming pitch analysis: {str(e)}")
         return []
 
 
+def compare_threshold_estimators(pitches, k=2.5, block_frames=1300, relative_accuracy=0.005):
+    """
+    Report the error of the sketch based estimate against the exact np.percentile path
+    on a full pitch matrix, feeding the sketch the same blocks of frames the streaming path would.
+
+    :return: Dictionary with the exact and streaming values and their relative errors.
+    """
+    positive_all = pitches[pitches > 0]
+    if positive_all.size == 0:
+        return None
+
+    sketch = QuantileSketch(relative_accuracy)
+    moments = RunningMoments()
+    for start in range(0, pitches.shape[1], block_frames):
+        block = pitches[:, start:start + block_frames]
+        positive = block[block > 0]
+        sketch.add(positive)
+        moments.add(positive)
+
+    report = {}
+    for name, q in (("q1", 25), ("median", 50), ("q3", 75), ("p65", 65), ("p80", 80)):
+        exact = float(np.percentile(positive_all, q))
+        estimate = sketch.percentile(q)
+        report[name] = {"exact": exact, "streaming": estimate, "relative_error": abs(estimate - exact) / exact}
+
+    exact_threshold = float(determine_dynamic_threshold(pitches, k))
+    streaming_threshold = float(threshold_from_sketch(sketch, moments, k))
+    report["threshold"] = {
+        "exact": exact_threshold,
+        "streaming": streaming_threshold,
+        "relative_error": abs(streaming_threshold - exact_threshold) / exact_threshold
+    }
+    report["sketch_buckets"] = len(sketch.buckets)
+
+    for name, values in report.items():
+        if isinstance(values, dict):
+            print(f"{name}: exact {values['exact']:.2f} Hz, streaming {values['streaming']:.2f} Hz, "
+                  f"relative error {values['relative_error']:.2e}")
+    print(f"Sketch size: {report['sketch_buckets']} buckets")
+    return report
+
+
+def retune_high_pitch_segments(features, k=2.5, time_interval=0.5, min_duration=2, min_separation=10, verbose=True):
+    """
+    Re-derive the threshold and the high pitch segments for new parameters from a match's
+    persisted spectral features (see spectral_features.load_spectral_features).
+    Takes milliseconds, so parameters can be tuned without re-running the pitch analysis.
+    """
+    pitch_threshold = threshold_from_summaries(features, k, verbose)
+    if pitch_threshold is None:
+        return []
+
+    return scan_high_pitch_segments(
+        np.asarray(features["pitch_max"]), pitch_threshold, features["frame_time_step"],
+        time_interval, min_duration, min_separation
+    )
+
+
+def sweep_pitch_parameters(features, parameter_sets):
+    """
+    Evaluate several parameter sets against one match's features.
+
+    :param features: Spectral features of a match, as returned by load_spectral_features.
+    :param parameter_sets: Iterable of dictionaries with any of k, time_interval, min_duration, min_separation.
+    :return: List of (parameters, high pitch segments) tuples.
+    """
+    frame_max = np.asarray(features["pitch_max"])
+    features = dict(features, pitch_max=frame_max)
+    return [
+        (parameters, retune_high_pitch_segments(features, verbose=False, **parameters))
+        for parameters in parameter_sets
+    ]
+
+
 def save_high_pitch_analysis(audio_path):
     """
     Runs pitch analysis and saves detected high pitch segments to a JSON file.
@@ -136,3 +357,26 @@ def save_high_pitch_analysis(audio_path):
     except Exception as e:
         print(f"Error in pitch analysis: {str(e)}")
         return None
+
+
+def build_transcription_windows(high_pitch_segments, padding=20.0, total_duration=None):
+    """
+    Build merged (start, end) windows in seconds around high pitch peaks.
+    Each peak is padded on both sides so commentary inside the clip matching tolerance is kept,
+    and overlapping windows are merged so no audio is transcribed twice.
+    """
+    windows = []
+    for segment in sorted(high_pitch_segments, key=lambda s: s["timestamp"]):
+        start = max(segment["timestamp"] - padding, 0.0)
+        end = segment["timestamp"] + padding
+        if total_duration is not None:
+            end = min(end, total_duration)
+        if start >= end:
+            continue
+
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+
+    return [(start, end) for start, end in windows]
@@ -0,0 +1,80 @@
+import json
+
+from app import (
+    transcribe_audio_chunked,
+    transcribe_around_pitch_peaks,
+    find_goal_sentences,
+)
+from extract_goal_clips import load_pitch_analysis, find_matching_goal
+
+
+def _to_goal_events(goal_sentences):
+    """
+    Convert detected goal sentences with "12.34s" timestamps to goal events with float timestamps.
+    """
+    return [
+        {
+            "start": float(entry["start"].replace("s", "").strip()),
+            "end": float(entry["end"].replace("s", "").strip()),
+            "sentence": entry["sentence"]
+        }
+        for entry in goal_sentences
+    ]
+
+
+def matched_pitch_timestamps(pitch_data, goal_events):
+    """
+    Return the pitch timestamps that extract_goal_clips would cut a clip around.
+    """
+    return {
+        segment["timestamp"]
+        for segment in pitch_data
+        if find_matching_goal(segment["timestamp"], goal_events) is not None
+    }
+
+
+def compare_gated_recall(processed_audio_path):
+    """
+    Compare pitch-gated transcription against full transcription on the same processed audio.
+    Recall is measured on matched pitch peaks, i.e. the events that end up as highlight clips.
+
+    :param processed_audio_path: Path to the 16 kHz mono audio produced by preprocess_audio.
+    :return: Dictionary with the matched peaks of each mode and the recall of the gated mode.
+    """
+    pitch_analysis_file, gated_transcription = transcribe_around_pitch_peaks(processed_audio_path)
+    if pitch_analysis_file is None:
+        print("No high pitch segments detected, nothing to compare.")
+        return None
+    pitch_data = load_pitch_analysis(pitch_analysis_file)
+
+    full_transcription = transcribe_audio_chunked(processed_audio_path)
+
+    full_matches = matched_pitch_timestamps(pitch_data, _to_goal_events(find_goal_sentences(full_transcription)))
+    gated_matches = matched_pitch_timestamps(pitch_data, _to_goal_events(find_goal_sentences(gated_transcription)))
+
+    recall = len(full_matches & gated_matches) / len(full_matches) if full_matches else 1.0
+
+    print(f"Full transcription: {len(full_transcription)} segments, {len(full_matches)} matched pitch peaks")
+    print(f"Pitch-gated transcription: {len(gated_transcription)} segments, {len(gated_matches)} matched pitch peaks")
+    print(f"Recall of pitch-gated mode against full transcription: {recall:.2%}")
+    missed = sorted(full_matches - gated_matches)
+    if missed:
+        print(f"Missed pitch peaks (s): {missed}")
+
+    return {
+        "full_matches": sorted(full_matches),
+        "gated_matches": sorted(gated_matches),
+        "missed": missed,
+        "recall": recall
+    }
+
+
+def main():
+    processed_audio_path = "D:/FOOTECH/backend/TRANSCRIPTIONS/processed_audio.wav"
+    report = compare_gated_recall(processed_audio_path)
+    if report is not None:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import math
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with bounded relative error (logarithmic buckets, as in DDSketch).
+    Every positive value is counted in the bucket i with gamma^(i-1) < x <= gamma^i, so memory
+    only grows with the logarithm of the value range and two sketches merge by adding counts.
+    Any quantile is returned within relative_accuracy of a value of the right rank.
+    """
+
+    def __init__(self, relative_accuracy=0.005):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0
+
+    def add(self, values):
+        """
+        Add a block of positive values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[values > 0]
+        if values.size == 0:
+            return
+        indices = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        unique, counts = np.unique(indices, return_counts=True)
+        for index, count in zip(unique.tolist(), counts.tolist()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += int(values.size)
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch with the same relative accuracy into this one.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        return self
+
+    def percentile(self, q):
+        """
+        Approximate np.percentile(values, q) for q in [0, 100].
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100.0 * (self.count - 1)
+        cumulative = 0
+        for index in sorted(self.buckets):
+            cumulative += self.buckets[index]
+            if cumulative > rank:
+                # Midpoint of the bucket in relative terms, so the error is at most relative_accuracy
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class RunningMoments:
+    """
+    Running count, mean and variance updated block by block and mergeable (Chan et al.).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        block = RunningMoments()
+        block.count = int(values.size)
+        block.mean = float(values.mean())
+        block.m2 = float(np.square(values - block.mean).sum())
+        self.merge(block)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def std(self):
+        """
+        Population standard deviation, like np.std.
+        """
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
@@ -0,0 +1,131 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Default limits; override with environment variables on the serving host
+MAX_RUNNING_JOBS = int(os.environ.get("FOOTECH_MAX_RUNNING_JOBS", 2))
+MAX_QUEUED_JOBS = int(os.environ.get("FOOTECH_MAX_QUEUED_JOBS", 4))
+RESOURCE_LIMITS = {
+    # Whisper / SBERT model inference on the GPU
+    "inference": int(os.environ.get("FOOTECH_INFERENCE_SLOTS", 1)),
+    # Concurrent ffmpeg / ffprobe subprocesses
+    "ffmpeg": int(os.environ.get("FOOTECH_FFMPEG_SLOTS", max(1, (os.cpu_count() or 2) // 2))),
+    # Stages holding a full match in memory (librosa load + STFT, decoded audio)
+    "memory": int(os.environ.get("FOOTECH_MEMORY_SLOTS", 1)),
+    # Decoders following an upload in progress; they mostly wait on the network, so they are kept out of "ffmpeg"
+    "stream": int(os.environ.get("FOOTECH_STREAM_SLOTS", MAX_RUNNING_JOBS)),
+}
+# Slots are taken in this order when nested (memory before inference) and never while a "stream" or
+# "ffmpeg" slot is held, so no two jobs can wait on each other
+
+
+class JobTicket:
+    """
+    Admission granted to one upload. Entering waits for a running job slot (the job is queued
+    until then); leaving, or release(), frees its place in the queue and its job slot.
+    """
+
+    def __init__(self, governor):
+        self._governor = governor
+        self._running = False
+        self._released = False
+
+    def __enter__(self):
+        self._governor._start_job()
+        self._running = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._governor._finish_job(self._running)
+
+
+class ResourceGovernor:
+    """
+    Global limits for the upload service: a bounded number of running and queued jobs, and
+    separate slot pools for model inference, ffmpeg subprocesses and memory-heavy stages.
+    Usage counters are kept for capacity planning (see stats()).
+    """
+
+    def __init__(self, max_running_jobs=MAX_RUNNING_JOBS, max_queued_jobs=MAX_QUEUED_JOBS, limits=None):
+        self.max_running_jobs = max_running_jobs
+        self.max_queued_jobs = max_queued_jobs
+        self.limits = dict(limits or RESOURCE_LIMITS)
+        self._lock = threading.Lock()
+        self._job_slots = threading.Semaphore(max_running_jobs)
+        self._admitted = 0
+        self._running = 0
+        self._rejected = 0
+        self._slots = {name: threading.Semaphore(limit) for name, limit in self.limits.items()}
+        self._in_use = {name: 0 for name in self.limits}
+        self._waiting = {name: 0 for name in self.limits}
+
+    def try_admit(self):
+        """
+        Admit a new job if the running jobs and the queue have room.
+
+        :return: A JobTicket, or None if the service is full and the request should be retried later.
+        """
+        with self._lock:
+            if self._admitted >= self.max_running_jobs + self.max_queued_jobs:
+                self._rejected += 1
+                return None
+            self._admitted += 1
+        return JobTicket(self)
+
+    def _start_job(self):
+        self._job_slots.acquire()
+        with self._lock:
+            self._running += 1
+
+    def _finish_job(self, running):
+        with self._lock:
+            self._admitted -= 1
+            if running:
+                self._running -= 1
+        if running:
+            self._job_slots.release()
+
+    @contextmanager
+    def slot(self, name):
+        """
+        Hold one slot of the named resource pool for the duration of the block.
+        """
+        with self._lock:
+            self._waiting[name] += 1
+        self._slots[name].acquire()
+        with self._lock:
+            self._waiting[name] -= 1
+            self._in_use[name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use[name] -= 1
+            self._slots[name].release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "jobs": {
+                    "running": self._running,
+                    "queued": self._admitted - self._running,
+                    "max_running": self.max_running_jobs,
+                    "max_queued": self.max_queued_jobs,
+                    "rejected": self._rejected
+                },
+                "resources": {
+                    name: {"limit": limit, "in_use": self._in_use[name], "waiting": self._waiting[name]}
+                    for name, limit in self.limits.items()
+                }
+            }
+
+
+# Shared by every module of the service
+governor = ResourceGovernor()
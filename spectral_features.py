@@ -0,0 +1,143 @@
+import os
+import json
+import librosa
+import numpy as np
+from resource_governor import governor
+
+# Rows of the per-match feature file, one value per STFT frame.
+# pitch_count/pitch_sum/pitch_sumsq summarise the positive piptrack pitches of each frame.
+FEATURE_NAMES = ["pitch_max", "rms", "spectral_flux", "pitch_count", "pitch_sum", "pitch_sumsq"]
+
+N_FFT = 2048
+HOP_LENGTH = 512
+# STFT frames per block when deriving per-frame values, bounding the temporaries to a few MB
+FEATURE_BLOCK_FRAMES = 4096
+
+# Log-spaced histogram of all positive pitches (1 cent bins), used to re-derive pitch quantiles
+HISTOGRAM_FMIN = 50.0
+HISTOGRAM_BINS_PER_OCTAVE = 1200
+
+
+def feature_file_paths(audio_path):
+    """
+    Paths of the memory-mapped feature matrix and its JSON metadata for an audio file.
+    """
+    base = audio_path.replace(".wav", "_spectral_features")
+    return base + ".npy", base + ".json"
+
+
+def histogram_file_path(audio_path):
+    return audio_path.replace(".wav", "_pitch_histogram.npy")
+
+
+def pitch_histogram_edges(sr):
+    """
+    Bin edges of the pitch histogram, from HISTOGRAM_FMIN up to the Nyquist frequency.
+    """
+    num_bins = int(np.ceil(np.log2((sr / 2) / HISTOGRAM_FMIN) * HISTOGRAM_BINS_PER_OCTAVE))
+    return HISTOGRAM_FMIN * 2.0 ** (np.arange(num_bins + 1) / HISTOGRAM_BINS_PER_OCTAVE)
+
+
+def compute_spectral_features(audio_path, k=2.5):
+    """
+    Compute the STFT of the audio once and derive per-frame pitch max, RMS energy, spectral flux and
+    positive pitch count/sum/sum of squares. The features are written to a memory-mapped .npy file next
+    to the audio, together with a log-spaced histogram of all positive pitches and a JSON file holding
+    the frame timing and the dynamic pitch threshold of the full pitch matrix.
+    """
+    # Imported here because pitch_analysis reads its input from this module
+    from pitch_analysis import determine_dynamic_threshold
+
+    # Loading a full match and its STFT is the most memory hungry stage of the pipeline
+    with governor.slot("memory"):
+        y, sr = librosa.load(audio_path, sr=None)
+        print(f"Computing spectral features for {audio_path}, sample rate: {sr}")
+
+        S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+        pitches, _ = librosa.piptrack(S=S, sr=sr, n_fft=N_FFT, hop_length=HOP_LENGTH)
+
+        num_frames = S.shape[1]
+        features_path, metadata_path = feature_file_paths(audio_path)
+        features = np.lib.format.open_memmap(features_path, mode="w+", dtype=np.float32, shape=(len(FEATURE_NAMES), num_frames))
+        features[0] = pitches.max(axis=0)
+        features[1] = librosa.feature.rms(S=S, frame_length=N_FFT, hop_length=HOP_LENGTH)[0]
+        # Half-wave rectified spectral flux: energy of the magnitude increase between consecutive frames.
+        # Computed in column blocks so no temporary the size of the spectrogram is created.
+        flux = np.zeros(num_frames, dtype=np.float32)
+        for start in range(1, num_frames, FEATURE_BLOCK_FRAMES):
+            stop = min(start + FEATURE_BLOCK_FRAMES, num_frames)
+            increase = np.subtract(S[:, start:stop], S[:, start - 1:stop - 1])
+            np.maximum(increase, 0, out=increase)
+            flux[start:stop] = np.sqrt(np.einsum("ij,ij->j", increase, increase))
+        features[2] = flux
+        # The spectrogram is not needed past RMS and flux; free it before the pitch statistics
+        del S
+        features[3] = np.count_nonzero(pitches > 0, axis=0)
+        features[4] = pitches.sum(axis=0, dtype=np.float64)
+        # Per-frame sum of squares without a float64 copy of the pitch matrix
+        features[5] = np.einsum("ij,ij->j", pitches, pitches, dtype=np.float64)
+        features.flush()
+        del features
+
+        pitch_threshold = determine_dynamic_threshold(pitches, k=k)
+        edges = pitch_histogram_edges(sr)
+        positive = pitches[pitches > 0]
+        # Values outside the edges are clipped into the first/last bin so the counts stay complete
+        histogram, _ = np.histogram(np.clip(positive, edges[0], edges[-1]), bins=edges)
+        np.save(histogram_file_path(audio_path), histogram.astype(np.int64))
+
+        metadata = {
+            "features": FEATURE_NAMES,
+            "sample_rate": sr,
+            "n_fft": N_FFT,
+            "hop_length": HOP_LENGTH,
+            "num_frames": num_frames,
+            "duration": len(y) / sr,
+            "k": k,
+            "pitch_threshold": None if pitch_threshold is None else float(pitch_threshold)
+        }
+        with open(metadata_path, "w") as file:
+            json.dump(metadata, file, indent=4)
+
+    print(f"Spectral features saved to: {features_path}")
+    return load_spectral_features(audio_path)
+
+
+def load_spectral_features(audio_path):
+    """
+    Load the feature file of an audio file as read-only memory maps.
+
+    :return: Dictionary with one array per feature name plus the metadata, or None if missing.
+    """
+    features_path, metadata_path = feature_file_paths(audio_path)
+    if not (os.path.exists(features_path) and os.path.exists(metadata_path)):
+        return None
+
+    with open(metadata_path, "r") as file:
+        metadata = json.load(file)
+    matrix = np.load(features_path, mmap_mode="r")
+
+    features = dict(metadata)
+    for row, name in enumerate(metadata["features"]):
+        features[name] = matrix[row]
+    # Seconds per frame, matching the scan in perform_pitch_analysis
+    features["frame_time_step"] = metadata["duration"] / metadata["num_frames"]
+    histogram_path = histogram_file_path(audio_path)
+    if os.path.exists(histogram_path):
+        features["pitch_histogram"] = np.load(histogram_path)
+        features["pitch_histogram_edges"] = pitch_histogram_edges(metadata["sample_rate"])
+    return features
+
+
+def get_spectral_features(audio_path):
+    """
+    Return the spectral features of an audio file, computing them only if they are missing,
+    older than the audio file or from an older feature layout.
+    The stored threshold is for the k used at compute time; derive other k with threshold_from_summaries.
+    """
+    features_path, metadata_path = feature_file_paths(audio_path)
+    if os.path.exists(features_path) and os.path.getmtime(features_path) >= os.path.getmtime(audio_path):
+        features = load_spectral_features(audio_path)
+        if features is not None and features["features"] == FEATURE_NAMES and "pitch_histogram" in features:
+            return features
+    return compute_spectral_features(audio_path)
@@ -2,6 +2,7 @@ from faster_whisper import WhisperModel
 import os
 import ffmpeg
 import json  # Import the json module to handle JSON file operations
+from word_index import WordTimestampIndex, collect_words, WORD_INDEX_FILENAME
 
 
 def preprocess_audio(input_file, output_file):
@@ -15,12 +16,14 @@ def preprocess_audio(input_file, output_file):
 def transcribe_audio_with_timestamps(audio_file, model_size="small", output_json_file="transcription.json"):
     """
     Transcribe the audio file using Faster-Whisper with CUDA and save the transcription to a JSON file.
+    The word timings are saved as a word index next to the JSON file.
     """
     model = WhisperModel(model_size, device="cuda", compute_type="float16")  # Enable GPU
     segments, _ = model.transcribe(audio_file, word_timestamps=True)
 
 
     transcription_with_timestamps = []
+    words = []
     current_sentence = ""
     start_time = None
 
@@ -31,6 +34,7 @@ def transcribe_audio_with_timestamps(audio_file, model_size="small", output_json
 
 
         current_sentence += segment.text + " "
+        words.extend(collect_words(segment))
 
 
         if segment.text.strip().endswith("."):
@@ -57,5 +61,8 @@ def transcribe_audio_with_timestamps(audio_file, model_size="small", output_json
 
 
     print(f"Transcription saved to {output_json_file}")
+
+    # Keep the word timings so clips can be centred on keywords without a second ASR pass
+    WordTimestampIndex(words).save(os.path.join(os.path.dirname(output_json_file), WORD_INDEX_FILENAME))
    
     return transcription_with_timestamps  # Optional return if needed for further processing
@@ -0,0 +1,220 @@
+import os
+import re
+import subprocess
+import threading
+import time
+import wave
+import numpy as np
+
+READ_CHUNK_SIZE = 1024 * 1024  # bytes copied per read from the request stream / growing file
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_WIDTH = 2  # s16le
+
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+def parse_content_range(header):
+    """
+    Parse a "bytes start-end/total" Content-Range header.
+
+    :return: Tuple (start, end, total) with total None when unknown, or None if the header is invalid.
+    """
+    match = CONTENT_RANGE_PATTERN.match(header or "")
+    if not match:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == "*" else int(match.group(3))
+    if end < start or (total is not None and end >= total):
+        return None
+    return start, end, total
+
+
+class UploadSession:
+    """
+    State of one resumable upload. Chunks are written straight into the job workspace and
+    readers following the growing file are woken up whenever new bytes land on disk.
+    """
+
+    def __init__(self, upload_id, workspace, filename, total_size):
+        self.upload_id = upload_id
+        self.workspace = workspace
+        self.total_size = total_size
+        # Only the (already validated) extension of the client filename is used; the file name itself is fixed
+        ext = filename.rsplit(".", 1)[1].lower()
+        self.video_path = os.path.join(workspace, f"uploaded_video.{ext}")
+        os.makedirs(workspace, exist_ok=True)
+        open(self.video_path, "ab").close()
+        self.received = os.path.getsize(self.video_path)
+        self.status = "uploading"
+        self.result = {}
+        self.aborted = False
+        self._lock = threading.Lock()
+        self._data_available = threading.Condition()
+        self.complete = threading.Event()
+
+    def write_chunk(self, offset, stream, length):
+        """
+        Append a chunk read from a request stream at the given offset.
+        Chunks must arrive in order; a mismatched offset is rejected so the client can resume
+        from the returned received byte count.
+
+        :return: Tuple (accepted, received).
+        """
+        with self._lock:
+            if self.aborted or self.complete.is_set() or offset != self.received:
+                return False, self.received
+
+            remaining = length
+            with open(self.video_path, "r+b") as f:
+                f.seek(offset)
+                while remaining > 0:
+                    data = stream.read(min(READ_CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    f.write(data)
+                    f.flush()
+                    remaining -= len(data)
+                    self.received += len(data)
+                    with self._data_available:
+                        self._data_available.notify_all()
+
+            if self.received >= self.total_size:
+                self.mark_complete()
+            return remaining == 0, self.received
+
+    def mark_complete(self):
+        self.complete.set()
+        with self._data_available:
+            self._data_available.notify_all()
+
+    def wait_for_data(self, position, timeout=1.0):
+        """
+        Block until more than `position` bytes have been received or the upload completed.
+        """
+        with self._data_available:
+            self._data_available.wait_for(lambda: self.received > position or self.complete.is_set(), timeout)
+
+    def wait_until_complete(self, idle_timeout):
+        """
+        Block until the upload is complete, giving up once no new bytes arrived for idle_timeout seconds.
+
+        :return: True if the upload completed.
+        """
+        while not self.complete.is_set():
+            received = self.received
+            self.wait_for_data(received, idle_timeout)
+            if self.received == received and not self.complete.is_set():
+                return False
+        return True
+
+    def abort(self, reason):
+        """
+        Give up on the upload: further chunks are rejected and the session reports the failure.
+        """
+        with self._lock:
+            self.aborted = True
+            self.status = "failed"
+            self.result = {"error": reason}
+
+    def to_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "received": self.received,
+            "size": self.total_size,
+            "complete": self.complete.is_set(),
+            "status": self.status,
+            **self.result
+        }
+
+
+def follow_growing_file(session, idle_timeout=60 * 60):
+    """
+    Yield the bytes of the uploaded file as they arrive, until the upload is complete and fully read
+    or no new data arrived for idle_timeout seconds (abandoned upload).
+    """
+    position = 0
+    last_data = time.time()
+    with open(session.video_path, "rb") as f:
+        while True:
+            available = session.received - position
+            if available > 0:
+                data = f.read(min(READ_CHUNK_SIZE, available))
+                position += len(data)
+                last_data = time.time()
+                yield data
+            elif session.complete.is_set() or time.time() - last_data > idle_timeout:
+                return
+            else:
+                session.wait_for_data(position)
+
+
+def _feed_ffmpeg(session, process, idle_timeout):
+    try:
+        for data in follow_growing_file(session, idle_timeout):
+            process.stdin.write(data)
+    except (BrokenPipeError, OSError):
+        # ffmpeg gave up on the input (e.g. MP4 with its index at the end); the caller falls back
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+
+
+def extract_audio_while_uploading(session, output_wav, on_audio_chunk, chunk_seconds=120, idle_timeout=60 * 60):
+    """
+    Decode 16 kHz mono audio from an upload that is still in progress.
+    The growing file is piped into ffmpeg, the decoded PCM is written to output_wav and every
+    chunk_seconds of audio is passed to on_audio_chunk(samples, offset_seconds) so transcription
+    can start before the upload finishes. Decoding stops once no new bytes arrived for idle_timeout seconds.
+
+    Containers that need seeking to be demuxed (MP4/MOV with the index at the end) cannot be read
+    this way; False is returned and the caller should process the finished file instead.
+    """
+    command = [
+        "ffmpeg", "-loglevel", "error", "-i", "pipe:0", "-vn",
+        "-ac", "1", "-ar", str(PCM_SAMPLE_RATE), "-f", "s16le", "pipe:1"
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    feeder = threading.Thread(target=_feed_ffmpeg, args=(session, process, idle_timeout), daemon=True)
+    feeder.start()
+
+    chunk_bytes = int(chunk_seconds * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH
+    pending = b""
+    offset_seconds = 0.0
+    started = time.time()
+
+    with wave.open(output_wav, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(PCM_SAMPLE_WIDTH)
+        wav_file.setframerate(PCM_SAMPLE_RATE)
+
+        while True:
+            data = process.stdout.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+            wav_file.writeframes(data)
+            pending += data
+            while len(pending) >= chunk_bytes:
+                chunk, pending = pending[:chunk_bytes], pending[chunk_bytes:]
+                on_audio_chunk(_pcm_to_float(chunk), offset_seconds)
+                offset_seconds += chunk_seconds
+
+        if len(pending) >= PCM_SAMPLE_WIDTH:
+            pending = pending[:len(pending) - len(pending) % PCM_SAMPLE_WIDTH]
+            on_audio_chunk(_pcm_to_float(pending), offset_seconds)
+            offset_seconds += len(pending) / (PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH)
+
+    return_code = process.wait()
+    feeder.join()
+    if return_code != 0 or offset_seconds == 0:
+        print(f"Streaming audio extraction failed for {session.video_path} (ffmpeg exit code {return_code})")
+        return False
+
+    print(f"Extracted {offset_seconds:.0f}s of audio while uploading in {time.time() - started:.0f}s")
+    return True
+
+
+def _pcm_to_float(data):
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
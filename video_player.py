@@ -1,31 +1,96 @@
+import threading
+import time
 import tkinter as tk
 import cv2
 import imageio
 from PIL import Image, ImageTk
+from frame_buffer import FrameRingBuffer
+
+WINDOW_WIDTH = 800
+WINDOW_HEIGHT = 450
+BUFFER_FRAMES = 32
+DEFAULT_FPS = 25.0
+
+
+def fit_size(frame_width, frame_height, max_width, max_height):
+    """Scale a frame size to fit inside the window while keeping its aspect ratio."""
+    scale = min(max_width / frame_width, max_height / frame_height)
+    return max(1, int(frame_width * scale)), max(1, int(frame_height * scale))
+
+
+def decode_frames(reader, buffer, width, height, stop_event):
+    """Decoder thread: read frames, scale them to the window size and fill the ring buffer."""
+    try:
+        for index, frame in enumerate(reader):
+            if stop_event.is_set():
+                break
+            if frame.shape[1] != width or frame.shape[0] != height:
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            while not buffer.put(index, frame, timeout=0.1):
+                if stop_event.is_set():
+                    return
+    except Exception as e:
+        print(f"Error decoding video: {e}")
+    finally:
+        buffer.finish()
+
 
 def play_video(video_path):
     """Function to play the extracted highlight video in a Tkinter window."""
     cap = imageio.get_reader(video_path)
+    metadata = cap.get_meta_data()
+    fps = metadata.get("fps") or DEFAULT_FPS
+    frame_width, frame_height = metadata.get("size", (WINDOW_WIDTH, WINDOW_HEIGHT))
+    width, height = fit_size(frame_width, frame_height, WINDOW_WIDTH, WINDOW_HEIGHT)
 
-    def update_frame():
-        try:
-            frame = cap.get_next_data()
-            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            img = Image.fromarray(frame)
-            img = ImageTk.PhotoImage(img)
-            label.config(image=img)
-            label.image = img
-            window.after(25, update_frame)  
-        except Exception:
-            cap.close()
-            window.destroy()
+    buffer = FrameRingBuffer(BUFFER_FRAMES)
+    stop_event = threading.Event()
+    decoder = threading.Thread(target=decode_frames, args=(cap, buffer, width, height, stop_event), daemon=True)
 
     window = tk.Toplevel()
     window.title("Highlight Playback")
-    window.geometry("800x450")
+    window.geometry(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}")
 
     label = tk.Label(window)
     label.pack()
+
+    start_time = None
+
+    def close():
+        stop_event.set()
+        buffer.close()
+        decoder.join(timeout=1)
+        cap.close()
+        window.destroy()
+
+    def update_frame():
+        nonlocal start_time
+        if buffer.exhausted:
+            close()
+            return
+
+        if start_time is None:
+            # Start the clock on the first decoded frame so decoder warm-up is not counted as lag
+            if buffer.peek_index() is None:
+                window.after(5, update_frame)
+                return
+            start_time = time.perf_counter()
+
+        due_index = int((time.perf_counter() - start_time) * fps)
+        entry = buffer.pop_due(due_index)
+        if entry is not None:
+            img = ImageTk.PhotoImage(Image.fromarray(entry[1]))
+            label.config(image=img)
+            label.image = img
+
+        next_index = buffer.peek_index()
+        if next_index is None:
+            next_index = due_index + 1
+        delay = start_time + next_index / fps - time.perf_counter()
+        window.after(max(1, int(delay * 1000)), update_frame)
+
+    window.protocol("WM_DELETE_WINDOW", close)
+    decoder.start()
     update_frame()
 
     window.mainloop()
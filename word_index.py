@@ -0,0 +1,95 @@
+import os
+import re
+import numpy as np
+
+WORD_INDEX_FILENAME = "word_index.npz"
+
+# Slack (in seconds) around a segment when searching its words; segment and word alignment differ slightly
+SEGMENT_SLACK = 0.5
+
+
+def normalize_word(text):
+    """
+    Lowercase a word and strip punctuation so transcript words and keywords compare equal.
+    """
+    return re.sub(r"[^\w']+", "", text.lower().replace("’", "'"))
+
+
+def collect_words(segment, offset=0.0):
+    """
+    Return (word, start, end) tuples for the words of a faster-whisper segment, shifted by offset seconds.
+    """
+    return [
+        (word.word, word.start + offset, word.end + offset)
+        for word in (segment.words or [])
+    ]
+
+
+class WordTimestampIndex:
+    """
+    Compact, searchable index of the word timings of one match transcription.
+    Words are kept sorted by start time so a time range is found by binary search.
+    """
+
+    def __init__(self, words):
+        words = sorted(
+            ((normalize_word(text), start, end) for text, start, end in words),
+            key=lambda word: word[1]
+        )
+        words = [word for word in words if word[0]]
+        self.words = np.array([word[0] for word in words], dtype=str)
+        self.starts = np.array([word[1] for word in words], dtype=np.float32)
+        self.ends = np.array([word[2] for word in words], dtype=np.float32)
+
+    def __len__(self):
+        return len(self.words)
+
+    def save(self, path):
+        np.savez_compressed(path, words=self.words, starts=self.starts, ends=self.ends)
+        print(f"Word index with {len(self)} words saved to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a saved index, or return None if the file does not exist.
+        """
+        if not os.path.exists(path):
+            return None
+        index = cls([])
+        with np.load(path) as data:
+            index.words = data["words"]
+            index.starts = data["starts"]
+            index.ends = data["ends"]
+        return index
+
+    def find_phrase(self, phrase, start, end):
+        """
+        Return (start, end) of the first occurrence of a phrase among the words starting in [start, end],
+        or None if the phrase is not spoken in that range.
+        """
+        tokens = [token for token in (normalize_word(part) for part in phrase.split()) if token]
+        if not tokens:
+            return None
+
+        lo = int(np.searchsorted(self.starts, start, side="left"))
+        hi = int(np.searchsorted(self.starts, end, side="right"))
+        for i in range(lo, hi - len(tokens) + 1):
+            if all(self.words[i + j] == token for j, token in enumerate(tokens)):
+                return float(self.starts[i]), float(self.ends[i + len(tokens) - 1])
+        return None
+
+    def locate_keyword(self, start, end, keywords):
+        """
+        Find the earliest keyword spoken within a transcription segment.
+
+        :return: Tuple (keyword, start, end) of the matched keyword, or None.
+        """
+        best = None
+        for keyword in keywords:
+            match = self.find_phrase(keyword, start - SEGMENT_SLACK, end + SEGMENT_SLACK)
+            if match is None:
+                continue
+            # Earliest keyword wins; on a tie prefer the longer (more specific) phrase
+            if best is None or (match[0], -len(keyword)) < (best[1], -len(best[0])):
+                best = (keyword, match[0], match[1])
+        return best